@@ -0,0 +1,67 @@
+from typing import Optional, Tuple
+import numpy as np
+
+try:
+    import numba
+    from numba import njit, prange
+except ImportError:  # optional, NumPy is used without it
+    numba = None
+
+
+if numba is not None:
+    # The explicit signature compiles the kernel at import (and caches it on
+    # disk) so the first query does not wait for the JIT. Fast-math leaves
+    # out nnan/ninf because the top-k slots start at infinity
+    @njit(
+        "Tuple((int64[:, ::1], float32[:, ::1]))(float32[:, ::1], float32[::1], int64, int64)",
+        parallel=True,
+        cache=True,
+        fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+    )
+    def _chunked_top_k(matrix, query, k, chunks):
+        """Squared L2 distances and top-k in one pass, a sorted top-k per chunk"""
+        rows, dims = matrix.shape
+        chunk_size = (rows + chunks - 1) // chunks
+        best_positions = np.full((chunks, k), -1, dtype=np.int64)
+        best_distances = np.full((chunks, k), np.inf, dtype=np.float32)
+
+        for chunk in prange(chunks):
+            end = min(rows, (chunk + 1) * chunk_size)
+            for row in range(chunk * chunk_size, end):
+                distance = np.float32(0.0)
+                for dim in range(dims):
+                    diff = matrix[row, dim] - query[dim]
+                    distance += diff * diff
+
+                # Insert into this chunk's sorted top-k
+                if distance < best_distances[chunk, k - 1]:
+                    slot = k - 1
+                    while slot > 0 and best_distances[chunk, slot - 1] > distance:
+                        best_distances[chunk, slot] = best_distances[chunk, slot - 1]
+                        best_positions[chunk, slot] = best_positions[chunk, slot - 1]
+                        slot -= 1
+                    best_distances[chunk, slot] = distance
+                    best_positions[chunk, slot] = row
+
+        return best_positions, best_distances
+
+
+def top_k_sqeuclidean(matrix: np.ndarray, query: np.ndarray, k: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Positions and squared L2 distances of the k nearest rows, or None without numba"""
+    if numba is None:
+        return None
+
+    positions, distances = _chunked_top_k(
+        np.ascontiguousarray(matrix, dtype=np.float32),
+        np.ascontiguousarray(query, dtype=np.float32),
+        k,
+        numba.get_num_threads()
+    )
+    # Merge the per-chunk results, dropping slots of chunks shorter than k
+    positions = positions.ravel()
+    distances = distances.ravel()
+    filled = positions >= 0
+    positions = positions[filled]
+    distances = distances[filled]
+    best = np.argsort(distances, kind='stable')[:k]
+    return positions[best], distances[best]
@@ -1,56 +1,267 @@
+import asyncio
 import aiosqlite
-import json
+import orjson
 import uuid
-from datetime import datetime
-from typing import List, Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional
+from pydantic import TypeAdapter
 from .models import Conversation, Message, ConversationListItem, RetrievedVerse
 import logging
 
 logger = logging.getLogger(__name__)
 
+_VERSES_ADAPTER = TypeAdapter(List[RetrievedVerse])
+
+# Timestamps are stored as INTEGER milliseconds since the Unix epoch (UTC)
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+
+# Converts an ISO-8601 column written by older versions to epoch milliseconds
+_ISO_TO_MILLIS = "CAST(ROUND((julianday({column}) - 2440587.5) * 86400000) AS INTEGER)"
+
+_CREATE_CONVERSATIONS = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        conversation_id TEXT NOT NULL,
+        title TEXT,
+        created_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (conversation_id)
+    ) WITHOUT ROWID
+"""
+
+_CREATE_MESSAGES = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conversation_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        retrieved_verses BLOB,
+        FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
+    )
+"""
+
+# Statements run while serving requests. Keeping them as constants makes
+# every call reuse the same text, which sqlite3 looks up in its per-connection
+# prepared statement cache instead of compiling it again.
+_SQL_INSERT_CONVERSATION = (
+    "INSERT INTO conversations (conversation_id, title, created_at, updated_at) "
+    "VALUES (?, ?, ?, ?)"
+)
+_SQL_INSERT_MESSAGE = (
+    "INSERT INTO messages (conversation_id, role, content, timestamp, retrieved_verses) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+_SQL_TOUCH_CONVERSATION = (
+    "UPDATE conversations SET updated_at = ?, message_count = message_count + ? "
+    "WHERE conversation_id = ?"
+)
+_SQL_SELECT_CONVERSATION = "SELECT title, created_at, updated_at FROM conversations WHERE conversation_id = ?"
+_SQL_SELECT_MESSAGES = (
+    "SELECT role, content, timestamp, retrieved_verses FROM messages "
+    "WHERE conversation_id = ? ORDER BY timestamp ASC, id ASC"
+)
+# The newest rows come off the index in descending order, then the small
+# LIMIT-sized result is put back in chronological order by SQLite
+_SQL_SELECT_RECENT_MESSAGES = """
+    SELECT role, content, timestamp, retrieved_verses FROM (
+        SELECT id, role, content, timestamp, retrieved_verses FROM messages
+        WHERE conversation_id = ?
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    )
+    ORDER BY timestamp ASC, id ASC
+"""
+_SQL_UPDATE_TITLE = "UPDATE conversations SET title = ? WHERE conversation_id = ?"
+_SQL_DELETE_MESSAGES = "DELETE FROM messages WHERE conversation_id = ?"
+_SQL_DELETE_CONVERSATION = "DELETE FROM conversations WHERE conversation_id = ?"
+_SQL_LIST_CONVERSATIONS = """
+    SELECT conversation_id, title, created_at, updated_at, message_count
+    FROM conversations
+    ORDER BY updated_at DESC
+    LIMIT ?
+"""
+
+
+def serialize_verses(retrieved_verses: Optional[List[RetrievedVerse]]) -> Optional[bytes]:
+    """Encode retrieved verses the way they are stored in the messages table"""
+    if not retrieved_verses:
+        return None
+    return orjson.dumps([v.model_dump() for v in retrieved_verses])
+
+
+def _to_millis(dt: datetime) -> int:
+    """Convert a naive UTC datetime to epoch milliseconds"""
+    return (dt - _EPOCH) // _MILLISECOND
+
+
+@lru_cache(maxsize=4096)
+def _from_millis(millis: int) -> datetime:
+    """Convert epoch milliseconds to a naive UTC datetime
+
+    Memoized because the same created_at/updated_at values are converted
+    again on every listing; datetimes are immutable so sharing is safe.
+    """
+    return _EPOCH + millis * _MILLISECOND
+
 
 class ConversationDatabase:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, cache_size: int = 128):
         self.db_path = db_path
+        self._db: Optional[aiosqlite.Connection] = None
+        # SQLite allows a single writer at a time
+        self._write_lock = asyncio.Lock()
+
+        # Read results are cached in-process and invalidated by every write
+        # going through this instance. The version counter keeps a read that
+        # raced with a write from caching what it saw before the write.
+        self._cache_size = cache_size
+        self._cache_version = 0
+        self._list_cache: Dict[int, List[ConversationListItem]] = {}
+        self._conv_cache: OrderedDict[str, Conversation] = OrderedDict()
 
     async def init_db(self):
-        """Initialize database tables"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    conversation_id TEXT PRIMARY KEY,
-                    title TEXT,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL
-                )
-            """)
+        """Open the shared connection and initialize database tables"""
+        self._db = await aiosqlite.connect(self.db_path, cached_statements=256)
+
+        db = self._db
+
+        # WAL lets readers proceed while a write is in progress, and with
+        # synchronous=NORMAL commits no longer fsync on every transaction
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute("PRAGMA synchronous=NORMAL")
+        await db.execute("PRAGMA temp_store=MEMORY")
+        await db.execute("PRAGMA cache_size=-64000")
+        await db.execute("PRAGMA mmap_size=268435456")
+        await db.execute("PRAGMA busy_timeout=5000")
+
+        async with self._write_lock:
+            # Schema creation and migrations are applied atomically
+            try:
+                await db.execute("BEGIN IMMEDIATE")
+                await db.execute(_CREATE_CONVERSATIONS.format(table="conversations"))
+                await db.execute(_CREATE_MESSAGES.format(table="messages"))
+
+                await self._migrate(db)
+
+                await db.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_messages_conv_ts
+                    ON messages(conversation_id, timestamp)
+                """)
+
+                # Covers every column list_conversations reads, so the listing is
+                # served from the index alone
+                await db.execute("DROP INDEX IF EXISTS idx_conv_updated")
+                await db.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_conv_updated_covering
+                    ON conversations(updated_at DESC, conversation_id, title, created_at, message_count)
+                """)
+
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+            logger.info("Database initialized successfully")
+
+    async def _migrate(self, db: aiosqlite.Connection):
+        """Bring databases created by older versions up to the current schema"""
+        async with db.execute("PRAGMA table_info(conversations)") as cursor:
+            columns = {row[1]: row[2] async for row in cursor}
 
+        if 'message_count' not in columns:
+            logger.info("Migrating conversations: adding message_count column")
+            await db.execute(
+                "ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0"
+            )
             await db.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    conversation_id TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    timestamp TEXT NOT NULL,
-                    retrieved_verses TEXT,
-                    FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
+                UPDATE conversations SET message_count = (
+                    SELECT COUNT(*) FROM messages
+                    WHERE messages.conversation_id = conversations.conversation_id
                 )
             """)
 
-            await db.commit()
-            logger.info("Database initialized successfully")
+        if columns['created_at'] == 'TEXT':
+            # Timestamps used to be ISO-8601 strings; rebuild both tables
+            # with epoch milliseconds so they sort and index as integers
+            logger.info("Migrating conversations and messages: storing timestamps as epoch milliseconds")
+            await self._rebuild_table(
+                db, "conversations", _CREATE_CONVERSATIONS,
+                columns="conversation_id, title, created_at, updated_at, message_count",
+                select=f"""conversation_id, title, {_ISO_TO_MILLIS.format(column="created_at")},
+                           {_ISO_TO_MILLIS.format(column="updated_at")}, message_count"""
+            )
+            await self._rebuild_table(
+                db, "messages", _CREATE_MESSAGES,
+                columns="id, conversation_id, role, content, timestamp, retrieved_verses",
+                select=f"""id, conversation_id, role, content,
+                           {_ISO_TO_MILLIS.format(column="timestamp")}, retrieved_verses"""
+            )
+
+        async with db.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'conversations'"
+        ) as cursor:
+            conversations_sql = (await cursor.fetchone())[0]
+
+        if 'WITHOUT ROWID' not in conversations_sql:
+            # Store conversation rows directly in the primary key B-tree
+            logger.info("Migrating conversations: rebuilding as WITHOUT ROWID")
+            columns = "conversation_id, title, created_at, updated_at, message_count"
+            await self._rebuild_table(
+                db, "conversations", _CREATE_CONVERSATIONS, columns=columns, select=columns
+            )
+
+    async def _rebuild_table(
+        self,
+        db: aiosqlite.Connection,
+        table: str,
+        create_sql: str,
+        columns: str,
+        select: str
+    ):
+        """Recreate a table with the current schema, copying its rows over"""
+        await db.execute(create_sql.format(table=f"{table}_new"))
+        await db.execute(
+            f"INSERT INTO {table}_new ({columns}) SELECT {select} FROM {table}"
+        )
+        await db.execute(f"DROP TABLE {table}")
+        await db.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    async def close(self):
+        """Close the shared connection"""
+        if self._db is not None:
+            await self._db.execute("PRAGMA optimize")
+            await self._db.close()
+            self._db = None
+            logger.info("Database connection closed")
+
+    def _invalidate(self, conversation_id: Optional[str] = None):
+        """Drop cached reads affected by a write to a conversation"""
+        self._cache_version += 1
+        self._list_cache.clear()
+        if conversation_id is not None:
+            self._conv_cache.pop(conversation_id, None)
 
     async def create_conversation(self, title: Optional[str] = None) -> str:
         """Create a new conversation and return its ID"""
         conversation_id = str(uuid.uuid4())
-        now = datetime.utcnow().isoformat()
-
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT INTO conversations (conversation_id, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
-                (conversation_id, title, now, now)
-            )
-            await db.commit()
+        now = _to_millis(datetime.utcnow())
+
+        db = self._db
+        async with self._write_lock:
+            try:
+                await db.execute(
+                    _SQL_INSERT_CONVERSATION,
+                    (conversation_id, title, now, now)
+                )
+                await db.commit()
+            except Exception:
+                # Don't leave the shared connection inside a failed transaction
+                await db.rollback()
+                raise
+            self._invalidate()
 
         logger.info(f"Created conversation {conversation_id}")
         return conversation_id
@@ -60,168 +271,229 @@ class ConversationDatabase:
         conversation_id: str,
         role: str,
         content: str,
-        retrieved_verses: Optional[List[RetrievedVerse]] = None
+        retrieved_verses: Optional[List[RetrievedVerse]] = None,
+        retrieved_verses_json: Optional[bytes] = None
     ) -> Message:
-        """Add a message to a conversation"""
-        now = datetime.utcnow()
+        """Add a message to a conversation
 
-        # Serialize retrieved verses if present
-        verses_json = None
-        if retrieved_verses:
-            verses_json = json.dumps([v.model_dump() for v in retrieved_verses])
+        retrieved_verses_json may carry the output of serialize_verses for
+        retrieved_verses when the caller already has it.
+        """
+        now = _to_millis(datetime.utcnow())
 
-        async with aiosqlite.connect(self.db_path) as db:
-            # Insert message
-            await db.execute(
-                "INSERT INTO messages (conversation_id, role, content, timestamp, retrieved_verses) VALUES (?, ?, ?, ?, ?)",
-                (conversation_id, role, content, now.isoformat(), verses_json)
-            )
-
-            # Update conversation timestamp
-            await db.execute(
-                "UPDATE conversations SET updated_at = ? WHERE conversation_id = ?",
-                (now.isoformat(), conversation_id)
-            )
+        # Serialize retrieved verses if present
+        verses_json = retrieved_verses_json
+        if verses_json is None:
+            verses_json = serialize_verses(retrieved_verses)
 
-            await db.commit()
+        await self._insert_messages(conversation_id, [(role, content, now, verses_json)])
 
         return Message(
             role=role,
             content=content,
-            timestamp=now,
+            timestamp=_from_millis(now),
+            retrieved_verses=retrieved_verses
+        )
+
+    async def add_message_pair(
+        self,
+        conversation_id: str,
+        user_content: str,
+        assistant_content: str,
+        retrieved_verses: Optional[List[RetrievedVerse]] = None,
+        user_timestamp: Optional[datetime] = None,
+        retrieved_verses_json: Optional[bytes] = None
+    ) -> Message:
+        """Add a user message and the assistant's reply in a single transaction"""
+        now = _to_millis(datetime.utcnow())
+        user_time = _to_millis(user_timestamp) if user_timestamp else now
+
+        verses_json = retrieved_verses_json
+        if verses_json is None:
+            verses_json = serialize_verses(retrieved_verses)
+
+        await self._insert_messages(conversation_id, [
+            ("user", user_content, user_time, None),
+            ("assistant", assistant_content, now, verses_json),
+        ])
+
+        return Message(
+            role="assistant",
+            content=assistant_content,
+            timestamp=_from_millis(now),
             retrieved_verses=retrieved_verses
         )
 
+    async def _insert_messages(self, conversation_id: str, rows: List[tuple]):
+        """Insert (role, content, timestamp, verses_json) rows and touch the conversation"""
+        db = self._db
+        async with self._write_lock:
+            try:
+                # Take the write lock up front so all statements share one commit
+                await db.execute("BEGIN IMMEDIATE")
+                await db.executemany(
+                    _SQL_INSERT_MESSAGE,
+                    [(conversation_id, *row) for row in rows]
+                )
+
+                # Update conversation timestamp and message count
+                await db.execute(
+                    _SQL_TOUCH_CONVERSATION,
+                    (rows[-1][2], len(rows), conversation_id)
+                )
+
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                # Reads on the shared connection may have cached the
+                # uncommitted rows before the rollback
+                self._invalidate(conversation_id)
+                raise
+
+            self._invalidate(conversation_id)
+
     async def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
         """Get a full conversation by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-
-            # Get conversation metadata
-            async with db.execute(
-                "SELECT * FROM conversations WHERE conversation_id = ?",
-                (conversation_id,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                if not row:
-                    return None
-
-                conv_data = dict(row)
-
-            # Get messages
-            messages = []
-            async with db.execute(
-                "SELECT * FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC",
-                (conversation_id,)
-            ) as cursor:
-                async for row in cursor:
-                    msg_data = dict(row)
-
-                    # Deserialize retrieved verses
-                    retrieved_verses = None
-                    if msg_data['retrieved_verses']:
-                        verses_data = json.loads(msg_data['retrieved_verses'])
-                        retrieved_verses = [RetrievedVerse(**v) for v in verses_data]
-
-                    messages.append(Message(
-                        role=msg_data['role'],
-                        content=msg_data['content'],
-                        timestamp=datetime.fromisoformat(msg_data['timestamp']),
-                        retrieved_verses=retrieved_verses
-                    ))
-
-        return Conversation(
-            conversation_id=conv_data['conversation_id'],
-            title=conv_data['title'],
+        cached = self._conv_cache.get(conversation_id)
+        if cached is not None:
+            self._conv_cache.move_to_end(conversation_id)
+            return cached
+
+        version = self._cache_version
+        db = self._db
+
+        # Get conversation metadata
+        async with db.execute(
+            _SQL_SELECT_CONVERSATION,
+            (conversation_id,)
+        ) as cursor:
+            conv_row = await cursor.fetchone()
+            if not conv_row:
+                return None
+
+        # Get messages
+        async with db.execute(
+            _SQL_SELECT_MESSAGES,
+            (conversation_id,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+
+        # The verses blob is parsed and validated in one pydantic-core pass
+        messages = [
+            Message(
+                role=row[0],
+                content=row[1],
+                timestamp=_from_millis(row[2]),
+                retrieved_verses=_VERSES_ADAPTER.validate_json(row[3]) if row[3] else None
+            )
+            for row in rows
+        ]
+
+        conversation = Conversation(
+            conversation_id=conversation_id,
+            title=conv_row[0],
             messages=messages,
-            created_at=datetime.fromisoformat(conv_data['created_at']),
-            updated_at=datetime.fromisoformat(conv_data['updated_at'])
+            created_at=_from_millis(conv_row[1]),
+            updated_at=_from_millis(conv_row[2])
         )
 
+        if version == self._cache_version:
+            self._conv_cache[conversation_id] = conversation
+            if len(self._conv_cache) > self._cache_size:
+                self._conv_cache.popitem(last=False)
+
+        return conversation
+
     async def get_recent_messages(
         self,
         conversation_id: str,
         limit: int = 10
     ) -> List[Message]:
         """Get the N most recent messages from a conversation"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-
-            messages = []
-            async with db.execute(
-                "SELECT * FROM messages WHERE conversation_id = ? ORDER BY timestamp DESC LIMIT ?",
-                (conversation_id, limit)
-            ) as cursor:
-                async for row in cursor:
-                    msg_data = dict(row)
-
-                    # Deserialize retrieved verses
-                    retrieved_verses = None
-                    if msg_data['retrieved_verses']:
-                        verses_data = json.loads(msg_data['retrieved_verses'])
-                        retrieved_verses = [RetrievedVerse(**v) for v in verses_data]
-
-                    messages.append(Message(
-                        role=msg_data['role'],
-                        content=msg_data['content'],
-                        timestamp=datetime.fromisoformat(msg_data['timestamp']),
-                        retrieved_verses=retrieved_verses
-                    ))
-
-            # Reverse to get chronological order
-            return list(reversed(messages))
+        db = self._db
+
+        async with db.execute(
+            _SQL_SELECT_RECENT_MESSAGES,
+            (conversation_id, limit)
+        ) as cursor:
+            rows = await cursor.fetchall()
+
+        return [
+            Message(
+                role=row[0],
+                content=row[1],
+                timestamp=_from_millis(row[2]),
+                retrieved_verses=_VERSES_ADAPTER.validate_json(row[3]) if row[3] else None
+            )
+            for row in rows
+        ]
 
     async def list_conversations(self, limit: int = 50) -> List[ConversationListItem]:
         """List all conversations, ordered by most recently updated"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-
-            conversations = []
-            async with db.execute(
-                """
-                SELECT
-                    c.*,
-                    COUNT(m.id) as message_count
-                FROM conversations c
-                LEFT JOIN messages m ON c.conversation_id = m.conversation_id
-                GROUP BY c.conversation_id
-                ORDER BY c.updated_at DESC
-                LIMIT ?
-                """,
-                (limit,)
-            ) as cursor:
-                async for row in cursor:
-                    data = dict(row)
-                    conversations.append(ConversationListItem(
-                        conversation_id=data['conversation_id'],
-                        title=data['title'],
-                        created_at=datetime.fromisoformat(data['created_at']),
-                        updated_at=datetime.fromisoformat(data['updated_at']),
-                        message_count=data['message_count']
-                    ))
-
-            return conversations
+        cached = self._list_cache.get(limit)
+        if cached is not None:
+            return cached
+
+        version = self._cache_version
+        db = self._db
+
+        async with db.execute(
+            _SQL_LIST_CONVERSATIONS,
+            (limit,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+
+        conversations = [
+            ConversationListItem(
+                conversation_id=row[0],
+                title=row[1],
+                created_at=_from_millis(row[2]),
+                updated_at=_from_millis(row[3]),
+                message_count=row[4]
+            )
+            for row in rows
+        ]
+
+        if version == self._cache_version:
+            self._list_cache[limit] = conversations
+
+        return conversations
 
     async def update_conversation_title(self, conversation_id: str, title: str):
         """Update a conversation's title"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "UPDATE conversations SET title = ? WHERE conversation_id = ?",
-                (title, conversation_id)
-            )
-            await db.commit()
+        db = self._db
+        async with self._write_lock:
+            try:
+                await db.execute(
+                    _SQL_UPDATE_TITLE,
+                    (title, conversation_id)
+                )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                self._invalidate(conversation_id)
+                raise
+            self._invalidate(conversation_id)
 
     async def delete_conversation(self, conversation_id: str):
         """Delete a conversation and all its messages"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "DELETE FROM messages WHERE conversation_id = ?",
-                (conversation_id,)
-            )
-            await db.execute(
-                "DELETE FROM conversations WHERE conversation_id = ?",
-                (conversation_id,)
-            )
-            await db.commit()
+        db = self._db
+        async with self._write_lock:
+            try:
+                await db.execute(
+                    _SQL_DELETE_MESSAGES,
+                    (conversation_id,)
+                )
+                await db.execute(
+                    _SQL_DELETE_CONVERSATION,
+                    (conversation_id,)
+                )
+                await db.commit()
+            except Exception:
+                # A half-done delete must not be committed by the next write
+                await db.rollback()
+                self._invalidate(conversation_id)
+                raise
+            self._invalidate(conversation_id)
 
         logger.info(f"Deleted conversation {conversation_id}")
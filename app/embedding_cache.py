@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bound parameters per lookup query, below SQLite's variable limit
+_LOOKUP_CHUNK = 500
+
+
+class EmbeddingCache:
+    """Embeddings persisted in a SQLite file, keyed by model and text"""
+
+    def __init__(self, path: str, model: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.model = model
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA mmap_size=268435456")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB NOT NULL PRIMARY KEY,
+                vector BLOB NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+
+    def _key(self, text: str) -> bytes:
+        """Hash the model name and text into a lookup key"""
+        return hashlib.sha256(f"{self.model}\0{text}".encode('utf-8')).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return the cached embedding of each text, None where missing"""
+        keys = [self._key(text) for text in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[i:i + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall())
+
+        return [
+            np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None
+            for key in keys
+        ]
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]):
+        """Store embeddings as float32 for the given texts"""
+        rows = [
+            (self._key(text), np.asarray(embedding, dtype=np.float32).tobytes())
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def close(self):
+        """Close the cache file"""
+        with self._lock:
+            self._conn.close()
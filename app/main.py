@@ -1,20 +1,25 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic_settings import BaseSettings
-from typing import Optional
+from datetime import datetime
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+import asyncio
 import logging
 import os
 
-from .database import ConversationDatabase
+from .database import ConversationDatabase, serialize_verses
 from .rag import BibleRAG
 from .models import (
     ChatRequest,
     ChatResponse,
     ConversationListResponse,
     Conversation,
-    Message
+    Message,
+    RetrievedVerse
 )
 
 # Configure logging
@@ -34,20 +39,34 @@ class Settings(BaseSettings):
     LLM_TEMPERATURE: float = 0.7
     LLM_MAX_TOKENS: int = 500
     QUERY_REWRITE_TEMPERATURE: float = 0.3
+    OLLAMA_KEEP_ALIVE: str = "1h"
 
     # RAG
     CONTEXT_WINDOW_SIZE: int = 2
     TOP_K_RESULTS: int = 5
+    EMBED_CONCURRENCY: int = 4
+    QUERY_EMBEDDING_CACHE_SIZE: int = 1024
+    IN_MEMORY_INDEX: bool = True
+    QUANTIZE_INDEX: bool = False
+    FAISS_INDEX: bool = False
+    EMBEDDING_CACHE_PATH: str = "/data/embeddings.db"
 
     # Query Rewriting
     QUERY_REWRITE_ENABLED: bool = True
     QUERY_CONTEXT_MESSAGES: int = 5
 
+    # Answer Cache
+    ANSWER_CACHE_SIZE: int = 512
+    ANSWER_CACHE_SIMILARITY: float = 0.95
+    GENERATION_CACHE_SIZE: int = 512
+    GENERATION_CACHE_SIMILARITY: float = 0.97
+
     # ChromaDB
     CHROMA_HOST: str = "chromadb"
     CHROMA_PORT: int = 8001
     CHROMA_PERSIST_DIR: str = "/data/chroma"
     CHROMA_COLLECTION: str = "kjv_bible"
+    CHROMA_ADD_BATCH_SIZE: int = 4096
 
     # SQLite
     SQLITE_DB_PATH: str = "/data/conversations.db"
@@ -70,34 +89,20 @@ class Settings(BaseSettings):
 # Initialize settings
 settings = Settings()
 
+# Plain snapshot of the validated settings, read by request handlers
+runtime = SimpleNamespace(**settings.model_dump())
+
 # Configure logging level
 logging.getLogger().setLevel(settings.LOG_LEVEL)
 
-# Initialize FastAPI app
-app = FastAPI(
-    title="Verbum Ex Machina",
-    description="RAG system for the King James Bible",
-    version="1.0.0"
-)
-
-# Configure CORS
-origins = settings.CORS_ORIGINS.split(",") if settings.CORS_ORIGINS != "*" else ["*"]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # Global instances
 db: Optional[ConversationDatabase] = None
 rag: Optional[BibleRAG] = None
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database and RAG system on startup"""
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize database and RAG system on startup, release them on shutdown"""
     global db, rag
 
     logger.info("Starting Verbum Ex Machina...")
@@ -121,6 +126,18 @@ async def startup_event():
         query_rewrite_temperature=settings.QUERY_REWRITE_TEMPERATURE,
         query_context_messages=settings.QUERY_CONTEXT_MESSAGES,
         query_rewrite_enabled=settings.QUERY_REWRITE_ENABLED,
+        answer_cache_size=settings.ANSWER_CACHE_SIZE,
+        answer_cache_similarity=settings.ANSWER_CACHE_SIMILARITY,
+        generation_cache_size=settings.GENERATION_CACHE_SIZE,
+        generation_cache_similarity=settings.GENERATION_CACHE_SIMILARITY,
+        embed_concurrency=settings.EMBED_CONCURRENCY,
+        query_embedding_cache_size=settings.QUERY_EMBEDDING_CACHE_SIZE,
+        in_memory_index=settings.IN_MEMORY_INDEX,
+        quantize_index=settings.QUANTIZE_INDEX,
+        faiss_index=settings.FAISS_INDEX,
+        embedding_cache_path=settings.EMBEDDING_CACHE_PATH,
+        add_batch_size=settings.CHROMA_ADD_BATCH_SIZE,
+        keep_alive=settings.OLLAMA_KEEP_ALIVE,
     )
 
     # Check if collection exists, if not initialize it
@@ -134,13 +151,45 @@ async def startup_event():
 
         verses = rag.load_bible(settings.BIBLE_JSON_PATH)
         verses_with_context = rag.create_verse_contexts(verses)
-        rag.initialize_collection(verses_with_context)
+        await rag.initialize_collection_async(verses_with_context)
         logger.info("ChromaDB collection initialized successfully")
     else:
         logger.info("Using existing ChromaDB collection")
 
+    # Searching a copy of the embeddings in process saves a round-trip to
+    # ChromaDB on every retrieval
+    rag.load_index()
+
+    # Load models ahead of the first chat so it does not pay the cold start
+    rag.warmup()
+
     logger.info("Verbum Ex Machina started successfully!")
 
+    yield
+
+    # Closing the connection also checkpoints the WAL
+    await db.close()
+    rag.close()
+
+
+# Initialize FastAPI app
+app = FastAPI(
+    title="Verbum Ex Machina",
+    description="RAG system for the King James Bible",
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+# Configure CORS
+origins = settings.CORS_ORIGINS.split(",") if settings.CORS_ORIGINS != "*" else ["*"]
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
 
 @app.get("/")
 async def read_root():
@@ -148,31 +197,23 @@ async def read_root():
     return FileResponse("app/static/index.html")
 
 
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Send a message and get a response"""
-    try:
-        # Get or create conversation
-        conversation_id = request.conversation_id
-        if not conversation_id:
-            conversation_id = await db.create_conversation()
-            logger.info(f"Created new conversation: {conversation_id}")
-
-        # Get recent messages for context
-        recent_messages = await db.get_recent_messages(
-            conversation_id,
-            limit=settings.QUERY_CONTEXT_MESSAGES
-        )
+def answer_message(
+    message: str,
+    recent_messages: List[Message]
+) -> Tuple[str, Optional[List[RetrievedVerse]], Optional[bytes]]:
+    """Run the RAG pipeline for a message
 
-        # Add user message to database
-        await db.add_message(
-            conversation_id=conversation_id,
-            role="user",
-            content=request.message
-        )
+    Returns the answer, its verses and the verses already encoded for
+    storage, so that work also stays off the event loop.
+    """
+    # Standalone questions (no prior turns) can be answered from the cache
+    cached = rag.lookup_answer(message) if not recent_messages else None
 
+    if cached:
+        answer, retrieved_verses = cached
+    else:
         # Analyze query
-        query_analysis = rag.analyze_query(request.message, recent_messages)
+        query_analysis = rag.analyze_query(message, recent_messages)
         logger.info(f"Query analysis: {query_analysis}")
 
         # Retrieve verses if needed
@@ -182,17 +223,65 @@ async def chat(request: ChatRequest):
 
         # Generate answer
         answer = rag.generate_answer(
-            query=request.message,
+            query=message,
             retrieved_verses=retrieved_verses,
             recent_messages=recent_messages
         )
 
-        # Save assistant message
-        assistant_message = await db.add_message(
+        if not recent_messages:
+            rag.store_answer(message, answer, retrieved_verses)
+
+    return answer, retrieved_verses, serialize_verses(retrieved_verses)
+
+
+async def discard_conversation(create_task: asyncio.Task):
+    """Delete the conversation started for a chat turn that failed"""
+    try:
+        conversation_id = await create_task
+        await db.delete_conversation(conversation_id)
+    except Exception as e:
+        logger.warning(f"Could not discard new conversation: {e}")
+
+
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    """Send a message and get a response"""
+    create_task = None
+    try:
+        received_at = datetime.utcnow()
+
+        conversation_id = request.conversation_id
+        if conversation_id:
+            # Get recent messages for context
+            recent_messages = await db.get_recent_messages(
+                conversation_id,
+                limit=runtime.QUERY_CONTEXT_MESSAGES
+            )
+        else:
+            # A new conversation has no history to fetch; create it while
+            # the answer is being produced
+            recent_messages = []
+            create_task = asyncio.create_task(db.create_conversation())
+
+        # The RAG pipeline makes blocking LLM and vector DB calls, so it runs
+        # in a worker thread and leaves the event loop free meanwhile
+        answer, retrieved_verses, verses_json = await asyncio.to_thread(
+            answer_message, request.message, recent_messages
+        )
+
+        if create_task:
+            conversation_id = await create_task
+            logger.info(f"Created new conversation: {conversation_id}")
+
+        # Save the user message and the reply together once the answer is
+        # ready, so a failed turn leaves no half-written exchange behind
+        assistant_message = await db.add_message_pair(
             conversation_id=conversation_id,
-            role="assistant",
-            content=answer,
-            retrieved_verses=retrieved_verses
+            user_content=request.message,
+            assistant_content=answer,
+            retrieved_verses=retrieved_verses,
+            user_timestamp=received_at,
+            retrieved_verses_json=verses_json
         )
 
         return ChatResponse(
@@ -203,6 +292,9 @@ async def chat(request: ChatRequest):
 
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}", exc_info=True)
+        if create_task:
+            # Leave no empty conversation (or unawaited task) behind
+            await discard_conversation(create_task)
         raise HTTPException(status_code=500, detail=str(e))
 
 
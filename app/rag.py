@@ -1,13 +1,77 @@
+import asyncio
+import hashlib
 import json
 import logging
+import threading
+from collections import OrderedDict, defaultdict
+from itertools import accumulate
 from typing import List, Dict, Optional, Tuple
-import ollama
+import httpx
+import ijson
+import numpy as np
+from pydantic import TypeAdapter
 import chromadb
 from chromadb.config import Settings
+from .embedding_cache import EmbeddingCache
+from .semantic_cache import SemanticCache
+from .vector_index import VectorIndex
 from .models import BibleVerse, VerseWithContext, RetrievedVerse, QueryAnalysis, Message
 
 logger = logging.getLogger(__name__)
 
+_RETRIEVED_VERSES_ADAPTER = TypeAdapter(List[RetrievedVerse])
+
+# Decimals kept in embeddings sent to Chroma, which stores them as float32
+_EMBEDDING_DECIMALS = 7
+
+# "embedding" records that verses are stored as unit-length vectors, the
+# scale queries are embedded at
+_COLLECTION_METADATA = {"description": "King James Bible verses with context", "embedding": "unit"}
+
+_ANALYZE_SYSTEM_PROMPT = """You are a query analysis assistant for a Bible Q&A system.
+
+Your task is to analyze the user's query and determine:
+1. Whether the query requires searching the Bible (needs_retrieval: true/false)
+2. If yes, rewrite the query to be a standalone, searchable question
+
+Examples:
+- "What is the Garden of Eden?" → needs_retrieval: true, rewritten: "What is the Garden of Eden?"
+- "Can you explain that more?" → needs_retrieval: true, rewritten: "Explain the Garden of Eden in more detail"
+- "Thank you!" → needs_retrieval: false
+- "What else does it say?" → needs_retrieval: true, rewritten: "What else does the Bible say about [previous topic]?"
+
+Respond in JSON format:
+{
+  "needs_retrieval": true/false,
+  "rewritten_query": "the standalone query if need_retrieval is true" or null,
+  "reasoning": "brief explanation"
+}"""
+
+_ANALYZE_USER_TEMPLATE = """Conversation context:
+{context_str}
+
+User's current query: {query}
+
+Analyze this query."""
+
+_ANSWER_SYSTEM_TEMPLATE = """You are a knowledgeable Bible assistant helping users understand Scripture.
+
+The following verses have been retrieved from the King James Bible as relevant to the user's question:
+
+{verses_context}
+
+Guidelines:
+- Answer the user's question based on the retrieved verses
+- Always cite specific verse references (e.g., Genesis 1:1, John 3:16)
+- Be accurate and faithful to the text
+- If the verses don't fully answer the question, acknowledge this
+- Be concise but thorough
+- Maintain a respectful, scholarly tone"""
+
+_ANSWER_SYSTEM_PROMPT_NO_VERSES = """You are a knowledgeable Bible assistant helping users understand Scripture.
+
+No specific verses were retrieved for this query. Answer based on the conversation context."""
+
 
 class BibleRAG:
     def __init__(
@@ -25,10 +89,40 @@ class BibleRAG:
         query_rewrite_temperature: float,
         query_context_messages: int,
         query_rewrite_enabled: bool,
+        answer_cache_size: int = 512,
+        answer_cache_similarity: float = 0.95,
+        generation_cache_size: int = 512,
+        generation_cache_similarity: float = 0.97,
+        embed_concurrency: int = 4,
+        query_embedding_cache_size: int = 1024,
+        in_memory_index: bool = True,
+        quantize_index: bool = False,
+        faiss_index: bool = False,
+        embedding_cache_path: str = "",
+        add_batch_size: int = 4096,
+        keep_alive: str = "1h",
     ):
-        self.ollama_client = ollama.Client(host=ollama_base_url)
+        # One pooled client carries every chat and embedding request, so
+        # they share connections kept open between requests
+        self.http_client = httpx.Client(
+            base_url=ollama_base_url,
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=64,
+                max_keepalive_connections=32,
+                keepalive_expiry=300.0
+            )
+        )
+        self.ollama_base_url = ollama_base_url
+        self._batch_embed_supported = True
+
+        # Verse context embeddings kept across restarts, see initialize_collection
+        self.embedding_cache_path = embedding_cache_path
+        self.embed_concurrency = max(1, embed_concurrency)
         self.llm_model = llm_model
         self.embedding_model = embedding_model
+        # How long Ollama keeps the models loaded after each request
+        self.keep_alive = keep_alive
         self.context_window_size = context_window_size
         self.top_k_results = top_k_results
         self.llm_temperature = llm_temperature
@@ -37,6 +131,26 @@ class BibleRAG:
         self.query_context_messages = query_context_messages
         self.query_rewrite_enabled = query_rewrite_enabled
 
+        # Answers and verses for standalone questions, matched on the
+        # normalized question or a near-duplicate phrasing
+        self.answer_cache = SemanticCache(
+            answer_cache_size, answer_cache_similarity, self._cached_embed, "Answer"
+        )
+
+        # Generated answers, grouped by the verses and history they were
+        # answered with. A new question reuses an answer only when those
+        # match and the question embeddings are very close
+        self.generation_cache = SemanticCache(
+            generation_cache_size, generation_cache_similarity, self._cached_embed, "Generation"
+        )
+
+        # Embeddings of recent queries, keyed by the SHA-256 of the exact text
+        self.query_embedding_cache_size = query_embedding_cache_size
+        self._query_embedding_cache: OrderedDict[bytes, List[float]] = OrderedDict()
+        self._query_embedding_hits = 0
+        self._query_embedding_misses = 0
+        self._query_embedding_lock = threading.Lock()
+
         # Initialize ChromaDB client
         self.chroma_client = chromadb.HttpClient(
             host=chroma_host,
@@ -45,14 +159,22 @@ class BibleRAG:
         )
         self.collection_name = chroma_collection
         self.collection = None
+        self.add_batch_size = add_batch_size
+
+        # Copy of the collection's embeddings searched in process, see load_index
+        self.in_memory_index = in_memory_index
+        self.quantize_index = quantize_index
+        self.faiss_index = faiss_index
+        self.index: Optional[VectorIndex] = None
 
     def load_bible(self, bible_json_path: str) -> List[BibleVerse]:
         """Load Bible verses from JSON file"""
         logger.info(f"Loading Bible from {bible_json_path}")
-        with open(bible_json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        verses = [BibleVerse(**verse) for verse in data]
+        # Stream the array so the whole parsed document is never held at once
+        verses = []
+        with open(bible_json_path, 'rb') as f:
+            for verse in ijson.items(f, 'item', use_float=True):
+                verses.append(BibleVerse(**verse))
         logger.info(f"Loaded {len(verses)} verses")
         return verses
 
@@ -61,27 +183,26 @@ class BibleRAG:
         logger.info("Creating context windows for verses")
 
         # Group verses by book and chapter
-        grouped: Dict[Tuple[str, str], List[BibleVerse]] = {}
+        grouped: Dict[Tuple[str, str], List[BibleVerse]] = defaultdict(list)
         for verse in verses:
-            key = (verse.book, verse.chapter)
-            if key not in grouped:
-                grouped[key] = []
-            grouped[key].append(verse)
-
-        # Sort each group by verse number
-        for key in grouped:
-            grouped[key].sort(key=lambda v: int(v.verse))
+            grouped[(verse.book, verse.chapter)].append(verse)
 
         # Create contexts
         verses_with_context = []
-        for (book, chapter), chapter_verses in grouped.items():
+        for chapter_verses in grouped.values():
+            chapter_verses.sort(key=lambda v: int(v.verse))
+
+            # Join the chapter once; each context is then a slice of it.
+            # starts[i] is where verse i begins, starts[-1] is one past the end
+            chapter_text = " ".join([v.content for v in chapter_verses])
+            starts = list(accumulate((len(v.content) + 1 for v in chapter_verses), initial=0))
+
             for i, verse in enumerate(chapter_verses):
                 # Get surrounding verses within the window
                 start_idx = max(0, i - self.context_window_size)
                 end_idx = min(len(chapter_verses), i + self.context_window_size + 1)
 
-                context_verses = chapter_verses[start_idx:end_idx]
-                context = " ".join([v.content for v in context_verses])
+                context = chapter_text[starts[start_idx]:starts[end_idx] - 1]
 
                 verses_with_context.append(VerseWithContext(
                     book=verse.book,
@@ -94,22 +215,279 @@ class BibleRAG:
         logger.info(f"Created {len(verses_with_context)} verses with context")
         return verses_with_context
 
+    def warmup(self):
+        """Load the models in Ollama and open pooled connections before the first request"""
+        try:
+            self._embed_query("warmup")
+            self._ollama_post("/api/chat", {
+                "model": self.llm_model,
+                "messages": [{"role": "user", "content": "Hi"}],
+                "stream": False,
+                "options": {"num_predict": 1},
+                "keep_alive": self.keep_alive
+            })
+            logger.info("Ollama models warmed up")
+        except Exception as e:
+            logger.warning(f"Ollama warm-up failed: {e}")
+
+    def close(self):
+        """Close the pooled Ollama connections"""
+        self.http_client.close()
+
+    def _ollama_post(self, path: str, payload: Dict) -> Dict:
+        """Send a request to the Ollama API and return the decoded response"""
+        response = self.http_client.post(path, json=payload)
+        response.raise_for_status()
+        return response.json()
+
     def embed_text(self, text: str) -> List[float]:
         """Generate embedding for text using Ollama"""
         try:
-            response = self.ollama_client.embeddings(
-                model=self.embedding_model,
-                prompt=text
-            )
+            response = self._ollama_post("/api/embeddings", {
+                "model": self.embedding_model,
+                "prompt": text,
+                "keep_alive": self.keep_alive
+            })
             return response['embedding']
         except Exception as e:
             logger.error(f"Error generating embedding: {e}")
             raise
 
+    def _cached_embed(self, text: str) -> List[float]:
+        """Embed a query, reusing the vector when the same text was seen recently"""
+        if self.query_embedding_cache_size <= 0:
+            return self._embed_query(text)
+
+        key = hashlib.sha256(text.encode('utf-8')).digest()
+        with self._query_embedding_lock:
+            embedding = self._query_embedding_cache.get(key)
+            if embedding is not None:
+                self._query_embedding_cache.move_to_end(key)
+                self._query_embedding_hits += 1
+                self._log_query_embedding_stats()
+                return embedding
+
+        embedding = self._embed_query(text)
+
+        with self._query_embedding_lock:
+            self._query_embedding_cache[key] = embedding
+            if len(self._query_embedding_cache) > self.query_embedding_cache_size:
+                self._query_embedding_cache.popitem(last=False)
+            self._query_embedding_misses += 1
+            self._log_query_embedding_stats()
+        return embedding
+
+    def _embed_query(self, text: str) -> List[float]:
+        """Embed a query at unit length, on the same scale as the verse embeddings"""
+        try:
+            return self._embed_batch([text])[0]
+        except Exception as e:
+            logger.error(f"Error generating query embedding: {e}")
+            raise
+
+    def _log_query_embedding_stats(self):
+        """Log the query embedding cache hit rate every 100 lookups"""
+        lookups = self._query_embedding_hits + self._query_embedding_misses
+        if lookups % 100 == 0:
+            logger.info(
+                f"Query embedding cache: {self._query_embedding_hits}/{lookups} hits, "
+                f"{len(self._query_embedding_cache)} entries"
+            )
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch via /api/embed, one text at a time if unsupported"""
+        if self._batch_embed_supported:
+            response = self.http_client.post(
+                "/api/embed",
+                json={"model": self.embedding_model, "input": texts, "keep_alive": self.keep_alive}
+            )
+            embeddings = self._batch_embeddings(response, len(texts))
+            if embeddings is not None:
+                return embeddings
+        return self._embed_each(texts)
+
+    async def _embed_batch_async(self, client: httpx.AsyncClient, texts: List[str]) -> List[List[float]]:
+        """Embed one batch via /api/embed without blocking the event loop"""
+        if self._batch_embed_supported:
+            response = await client.post(
+                "/api/embed",
+                json={"model": self.embedding_model, "input": texts, "keep_alive": self.keep_alive}
+            )
+            embeddings = self._batch_embeddings(response, len(texts))
+            if embeddings is not None:
+                return embeddings
+        return await asyncio.to_thread(self._embed_each, texts)
+
+    def _batch_embeddings(self, response: httpx.Response, count: int) -> Optional[List[List[float]]]:
+        """Read an /api/embed response, None if the server does not support it"""
+        if response.status_code < 400:
+            embeddings = response.json().get("embeddings")
+            if embeddings and len(embeddings) == count:
+                return embeddings
+        elif response.status_code >= 500:
+            response.raise_for_status()
+        # Older Ollama servers only offer /api/embeddings
+        logger.warning(
+            f"Batch embedding unavailable (HTTP {response.status_code}), "
+            "falling back to one request per text"
+        )
+        self._batch_embed_supported = False
+        return None
+
+    def _embed_each(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts one request at a time, scaled to unit length"""
+        # /api/embed returns unit-length vectors, so match it here and keep
+        # every stored embedding on the same scale
+        embeddings = []
+        for text in texts:
+            embedding = np.asarray(self.embed_text(text), dtype=np.float64)
+            norm = np.linalg.norm(embedding)
+            embeddings.append((embedding / norm if norm else embedding).tolist())
+        return embeddings
+
     def initialize_collection(self, verses_with_context: List[VerseWithContext]):
         """Initialize ChromaDB collection with Bible verses"""
+        asyncio.run(self.initialize_collection_async(verses_with_context))
+
+    async def initialize_collection_async(self, verses_with_context: List[VerseWithContext]):
+        """Initialize ChromaDB collection with Bible verses, adding them while the rest are embedded"""
         logger.info(f"Initializing ChromaDB collection: {self.collection_name}")
+        # Only indexing reads the embedding cache, so it is open for this run alone
+        embedding_cache = None
+        if self.embedding_cache_path:
+            embedding_cache = await asyncio.to_thread(
+                EmbeddingCache, self.embedding_cache_path, self.embedding_model
+            )
+        try:
+            self.index = None
+            await asyncio.to_thread(self._recreate_collection)
+            await self._embed_and_add_verses(verses_with_context, embedding_cache)
+        finally:
+            if embedding_cache:
+                await asyncio.to_thread(embedding_cache.close)
+
+        await asyncio.to_thread(self._mark_collection_complete)
+        logger.info("ChromaDB collection initialized successfully")
+
+    async def _embed_and_add_verses(
+        self,
+        verses_with_context: List[VerseWithContext],
+        embedding_cache: Optional[EmbeddingCache]
+    ):
+        """Embed verse contexts and add the verses to the new collection"""
+        logger.info("Generating embeddings for verses...")
+
+        # Embed the contexts (not just the verses). Verses sharing the same
+        # context, as in chapters shorter than the window, share one embedding
+        positions: Dict[str, List[int]] = defaultdict(list)
+        for i, verse in enumerate(verses_with_context):
+            positions[verse.context].append(i)
+        contexts = list(positions)
+        duplicates = len(verses_with_context) - len(contexts)
+        logger.info(
+            f"{len(contexts)} distinct contexts for {len(verses_with_context)} verses "
+            f"({duplicates / max(1, len(verses_with_context)):.1%} duplicates skipped)"
+        )
 
+        # Contexts embedded by an earlier run are read back from the on-disk cache
+        if embedding_cache:
+            context_embeddings = await asyncio.to_thread(embedding_cache.get_many, contexts)
+        else:
+            context_embeddings = [None] * len(contexts)
+        logger.info(f"Found {len(contexts) - context_embeddings.count(None)}/{len(contexts)} embeddings in cache")
+
+        # The rest are embedded in batches, keeping a few requests in flight so
+        # Ollama is never waiting on the client. Batches are drawn from the
+        # contexts sorted by length so each one holds inputs of similar size
+        # and little padding is processed
+        order = sorted(
+            (i for i, embedding in enumerate(context_embeddings) if embedding is None),
+            key=lambda i: len(contexts[i])
+        )
+        sorted_contexts = [contexts[i] for i in order]
+        embed_batch_size = 64
+
+        # Verses whose embedding is known are handed to the consumer, which
+        # adds them to Chroma while later batches are still being embedded
+        embeddings: List[Optional[List[float]]] = [None] * len(verses_with_context)
+        ready: asyncio.Queue = asyncio.Queue(maxsize=self.embed_concurrency)
+
+        def assign(context: str, embedding: List[float]) -> List[int]:
+            for i in positions[context]:
+                embeddings[i] = embedding
+            return positions[context]
+
+        async def produce():
+            try:
+                cached = [
+                    i
+                    for context, embedding in zip(contexts, context_embeddings)
+                    if embedding is not None
+                    for i in assign(context, embedding)
+                ]
+                if cached:
+                    await ready.put(cached)
+
+                semaphore = asyncio.Semaphore(self.embed_concurrency)
+                embedded = 0
+                async with httpx.AsyncClient(base_url=self.ollama_base_url, timeout=self.http_client.timeout) as client:
+                    async def embed(start: int):
+                        nonlocal embedded
+                        batch_contexts = sorted_contexts[start:start + embed_batch_size]
+                        async with semaphore:
+                            batch = await self._embed_batch_async(client, batch_contexts)
+                        if embedding_cache:
+                            await asyncio.to_thread(embedding_cache.put_many, batch_contexts, batch)
+                        embedded += len(batch)
+                        logger.info(f"Embedded {embedded}/{len(sorted_contexts)} contexts")
+                        await ready.put([
+                            i
+                            for context, embedding in zip(batch_contexts, batch)
+                            for i in assign(context, embedding)
+                        ])
+
+                    await asyncio.gather(*(
+                        embed(start) for start in range(0, len(sorted_contexts), embed_batch_size)
+                    ))
+            finally:
+                await ready.put(None)
+
+        async def consume():
+            # Add to collection in batches as large as the server accepts, so
+            # the whole Bible takes a handful of requests
+            batch_size = await asyncio.to_thread(self._add_batch_limit)
+            pending: List[int] = []
+            added = 0
+            while True:
+                indices = await ready.get()
+                if indices is not None:
+                    pending.extend(indices)
+                while len(pending) >= batch_size or (indices is None and pending):
+                    rows, pending = pending[:batch_size], pending[batch_size:]
+                    await asyncio.to_thread(
+                        self._add_verses,
+                        [verses_with_context[i] for i in rows],
+                        [embeddings[i] for i in rows]
+                    )
+                    added += len(rows)
+                    logger.info(f"Added {added}/{len(verses_with_context)} verses")
+                if indices is None:
+                    break
+
+        producer = asyncio.create_task(produce())
+        consumer = asyncio.create_task(consume())
+        try:
+            await asyncio.gather(producer, consumer)
+        except BaseException:
+            producer.cancel()
+            consumer.cancel()
+            # Verses are added while the rest are still being embedded, so a
+            # failed run leaves a partial collection behind
+            await asyncio.to_thread(self._discard_collection)
+            raise
+
+    def _recreate_collection(self):
+        """Drop the collection if it exists and create it empty"""
         # Delete existing collection if it exists
         try:
             self.chroma_client.delete_collection(name=self.collection_name)
@@ -117,61 +495,65 @@ class BibleRAG:
         except Exception:
             pass
 
-        # Create new collection
+        # Create new collection, marked as incomplete until every verse is added
         self.collection = self.chroma_client.create_collection(
             name=self.collection_name,
-            metadata={"description": "King James Bible verses with context"}
+            metadata={**_COLLECTION_METADATA, "status": "indexing"}
         )
 
-        # Prepare data for insertion
-        logger.info("Generating embeddings for verses...")
-        ids = []
-        embeddings = []
-        documents = []
-        metadatas = []
-
-        for i, verse in enumerate(verses_with_context):
-            # Generate unique ID
-            verse_id = f"{verse.book}_{verse.chapter}_{verse.verse}"
-            ids.append(verse_id)
-
-            # Embed the context (not just the verse)
-            embedding = self.embed_text(verse.context)
-            embeddings.append(embedding)
+    def _mark_collection_complete(self):
+        """Record that every verse has been added to the collection"""
+        self.collection.modify(metadata={**_COLLECTION_METADATA, "status": "complete"})
 
+    def _discard_collection(self):
+        """Delete a partially initialized collection"""
+        self.collection = None
+        try:
+            self.chroma_client.delete_collection(name=self.collection_name)
+            logger.info(f"Deleted incomplete collection: {self.collection_name}")
+        except Exception as e:
+            # The status left in its metadata still marks it for re-indexing
+            logger.warning(f"Could not delete incomplete collection {self.collection_name}: {e}")
+
+    def _add_batch_limit(self) -> int:
+        """Verses per add request, within the server's limit"""
+        if self.chroma_client.max_batch_size > 0:
+            return min(self.add_batch_size, self.chroma_client.max_batch_size)
+        return self.add_batch_size
+
+    def _add_verses(self, verses: List[VerseWithContext], embeddings: List[List[float]]):
+        """Add verses and their context embeddings to the collection"""
+        self.collection.add(
+            # Unique ID per verse
+            ids=[f"{verse.book}_{verse.chapter}_{verse.verse}" for verse in verses],
+            # Rounded values serialize to about half as many JSON characters
+            embeddings=np.round(np.asarray(embeddings, dtype=np.float64), _EMBEDDING_DECIMALS).tolist(),
             # Store the context as document
-            documents.append(verse.context)
-
-            # Store metadata
-            metadatas.append({
-                "book": verse.book,
-                "chapter": verse.chapter,
-                "verse": verse.verse,
-                "content": verse.content,
-                "context": verse.context
-            })
-
-            if (i + 1) % 100 == 0:
-                logger.info(f"Processed {i + 1}/{len(verses_with_context)} verses")
-
-        # Add to collection in batches
-        batch_size = 100
-        for i in range(0, len(ids), batch_size):
-            end_idx = min(i + batch_size, len(ids))
-            self.collection.add(
-                ids=ids[i:end_idx],
-                embeddings=embeddings[i:end_idx],
-                documents=documents[i:end_idx],
-                metadatas=metadatas[i:end_idx]
-            )
-            logger.info(f"Added batch {i//batch_size + 1}/{(len(ids)-1)//batch_size + 1}")
-
-        logger.info("ChromaDB collection initialized successfully")
+            documents=[verse.context for verse in verses],
+            metadatas=[
+                {
+                    "book": verse.book,
+                    "chapter": verse.chapter,
+                    "verse": verse.verse,
+                    "content": verse.content
+                }
+                for verse in verses
+            ]
+        )
 
     def get_or_create_collection(self):
         """Get existing collection or indicate it needs initialization"""
         try:
             self.collection = self.chroma_client.get_collection(name=self.collection_name)
+            metadata = self.collection.metadata or {}
+            if metadata.get("status") == "indexing":
+                logger.warning(f"Collection {self.collection_name} was not fully initialized, needs re-indexing")
+                return False
+            # Older collections hold raw embeddings, which unit-length queries
+            # would rank mostly by vector norm
+            if metadata.get("embedding") != _COLLECTION_METADATA["embedding"]:
+                logger.warning(f"Collection {self.collection_name} stores unnormalized embeddings, needs re-indexing")
+                return False
             count = self.collection.count()
             if count > 0:
                 logger.info(f"Retrieved existing collection: {self.collection_name} with {count} verses")
@@ -183,6 +565,18 @@ class BibleRAG:
             logger.warning(f"Collection {self.collection_name} does not exist")
             return False
 
+    def load_index(self):
+        """Load the collection's embeddings into memory for retrieval"""
+        if not self.in_memory_index:
+            return
+        if not self.collection:
+            raise RuntimeError("Collection not initialized. Call get_or_create_collection first.")
+        self.index = VectorIndex.from_collection(
+            self.collection,
+            quantize=self.quantize_index,
+            use_faiss=self.faiss_index
+        )
+
     def retrieve_verses(self, query: str) -> List[RetrievedVerse]:
         """Retrieve relevant verses for a query"""
         if not self.collection:
@@ -190,33 +584,41 @@ class BibleRAG:
 
         logger.info(f"Retrieving verses for query: {query}")
 
-        # Generate query embedding
-        query_embedding = self.embed_text(query)
+        # Generate query embedding, or reuse it for a repeated query
+        query_embedding = self._cached_embed(query)
 
-        # Query ChromaDB
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=self.top_k_results
-        )
-
-        # Parse results
-        retrieved_verses = []
-        if results['ids'] and results['ids'][0]:
-            for i in range(len(results['ids'][0])):
-                metadata = results['metadatas'][0][i]
-                distance = results['distances'][0][i]
-
-                # Convert distance to similarity score (1 - normalized distance)
-                score = 1 / (1 + distance)
-
-                retrieved_verses.append(RetrievedVerse(
-                    book=metadata['book'],
-                    chapter=metadata['chapter'],
-                    verse=metadata['verse'],
-                    content=metadata['content'],
-                    context=metadata['context'],
-                    score=score
-                ))
+        # Search the in-memory copy when loaded, otherwise query ChromaDB
+        if self.index is not None:
+            positions, distances = self.index.query(query_embedding, self.top_k_results)
+            metadatas = [self.index.metadatas[position] for position in positions]
+            documents = [self.index.documents[position] for position in positions]
+        else:
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=self.top_k_results
+            )
+            metadatas, documents, distances = [], [], []
+            if results['ids'] and results['ids'][0]:
+                metadatas = results['metadatas'][0]
+                documents = results['documents'][0]
+                distances = results['distances'][0]
+
+        # Convert distances to similarity scores (1 - normalized distance)
+        scores = (1 / (1 + np.asarray(distances, dtype=np.float64))).tolist()
+
+        # Parse results, validated as one list rather than verse by verse.
+        # The context is stored as the document rather than in the metadata
+        retrieved_verses = _RETRIEVED_VERSES_ADAPTER.validate_python([
+            {
+                "book": metadata['book'],
+                "chapter": metadata['chapter'],
+                "verse": metadata['verse'],
+                "content": metadata['content'],
+                "context": context,
+                "score": score
+            }
+            for metadata, context, score in zip(metadatas, documents, scores)
+        ])
 
         logger.info(f"Retrieved {len(retrieved_verses)} verses")
         return retrieved_verses
@@ -238,45 +640,23 @@ class BibleRAG:
         context_str = "\n".join(context_messages) if context_messages else "No previous context"
 
         # Create prompt for query analysis
-        system_prompt = """You are a query analysis assistant for a Bible Q&A system.
-
-Your task is to analyze the user's query and determine:
-1. Whether the query requires searching the Bible (needs_retrieval: true/false)
-2. If yes, rewrite the query to be a standalone, searchable question
-
-Examples:
-- "What is the Garden of Eden?" → needs_retrieval: true, rewritten: "What is the Garden of Eden?"
-- "Can you explain that more?" → needs_retrieval: true, rewritten: "Explain the Garden of Eden in more detail"
-- "Thank you!" → needs_retrieval: false
-- "What else does it say?" → needs_retrieval: true, rewritten: "What else does the Bible say about [previous topic]?"
-
-Respond in JSON format:
-{
-  "needs_retrieval": true/false,
-  "rewritten_query": "the standalone query if need_retrieval is true" or null,
-  "reasoning": "brief explanation"
-}"""
-
-        user_prompt = f"""Conversation context:
-{context_str}
-
-User's current query: {query}
-
-Analyze this query."""
+        user_prompt = _ANALYZE_USER_TEMPLATE.format(context_str=context_str, query=query)
 
         try:
-            response = self.ollama_client.chat(
-                model=self.llm_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
+            response = self._ollama_post("/api/chat", {
+                "model": self.llm_model,
+                "messages": [
+                    {"role": "system", "content": _ANALYZE_SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt}
                 ],
-                options={
+                "stream": False,
+                "options": {
                     "temperature": self.query_rewrite_temperature,
                     "num_predict": 200
                 },
-                format="json"
-            )
+                "format": "json",
+                "keep_alive": self.keep_alive
+            })
 
             # Parse JSON response
             result = json.loads(response['message']['content'])
@@ -298,6 +678,13 @@ Analyze this query."""
         recent_messages: List[Message]
     ) -> str:
         """Generate answer using LLM"""
+        context_key = None
+        if self.generation_cache.size > 0:
+            context_key = self._generation_context_key(retrieved_verses, recent_messages)
+            cached = self.generation_cache.get(query, context_key)
+            if cached is not None:
+                return cached
+
         # Build conversation history
         conversation = []
         for msg in recent_messages:
@@ -313,23 +700,9 @@ Analyze this query."""
                 for v in retrieved_verses
             ])
 
-            system_prompt = f"""You are a knowledgeable Bible assistant helping users understand Scripture.
-
-The following verses have been retrieved from the King James Bible as relevant to the user's question:
-
-{verses_context}
-
-Guidelines:
-- Answer the user's question based on the retrieved verses
-- Always cite specific verse references (e.g., Genesis 1:1, John 3:16)
-- Be accurate and faithful to the text
-- If the verses don't fully answer the question, acknowledge this
-- Be concise but thorough
-- Maintain a respectful, scholarly tone"""
+            system_prompt = _ANSWER_SYSTEM_TEMPLATE.format(verses_context=verses_context)
         else:
-            system_prompt = """You are a knowledgeable Bible assistant helping users understand Scripture.
-
-No specific verses were retrieved for this query. Answer based on the conversation context."""
+            system_prompt = _ANSWER_SYSTEM_PROMPT_NO_VERSES
 
         # Add system prompt and user query
         messages = [{"role": "system", "content": system_prompt}]
@@ -337,19 +710,47 @@ No specific verses were retrieved for this query. Answer based on the conversati
         messages.append({"role": "user", "content": query})
 
         try:
-            response = self.ollama_client.chat(
-                model=self.llm_model,
-                messages=messages,
-                options={
+            response = self._ollama_post("/api/chat", {
+                "model": self.llm_model,
+                "messages": messages,
+                "stream": False,
+                "options": {
                     "temperature": self.llm_temperature,
                     "num_predict": self.llm_max_tokens
-                }
-            )
+                },
+                "keep_alive": self.keep_alive
+            })
 
             answer = response['message']['content']
             logger.info(f"Generated answer: {answer[:100]}...")
-            return answer
 
         except Exception as e:
             logger.error(f"Error generating answer: {e}")
             raise
+
+        if context_key is not None:
+            self.generation_cache.put(query, answer, context_key)
+        return answer
+
+    def _generation_context_key(
+        self,
+        retrieved_verses: Optional[List[RetrievedVerse]],
+        recent_messages: List[Message]
+    ) -> str:
+        """Digest of the verse set and history an answer is generated from"""
+        verse_ids = sorted(f"{v.book}_{v.chapter}_{v.verse}" for v in retrieved_verses or [])
+        history = [[msg.role, msg.content] for msg in recent_messages]
+        return hashlib.sha256(json.dumps([verse_ids, history]).encode('utf-8')).hexdigest()
+
+    def lookup_answer(self, query: str) -> Optional[Tuple[str, Optional[List[RetrievedVerse]]]]:
+        """Return a cached answer and its verses for the same or a very similar question"""
+        return self.answer_cache.get(query)
+
+    def store_answer(
+        self,
+        query: str,
+        answer: str,
+        retrieved_verses: Optional[List[RetrievedVerse]]
+    ):
+        """Remember the answer to a standalone question"""
+        self.answer_cache.put(query, (answer, retrieved_verses))
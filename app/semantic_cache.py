@@ -0,0 +1,90 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """LRU of values keyed by question text, matched exactly or by embedding similarity
+
+    Entries live in groups (e.g. the context an answer was generated from)
+    and a question only matches entries of its own group. Questions are
+    embedded lazily, on a lookup that finds other entries in its group, so
+    storing never costs an embedding request.
+    """
+
+    def __init__(self, size: int, similarity: float, embed: Callable[[str], List[float]], name: str):
+        self.size = size
+        self.similarity = similarity
+        self.name = name
+        self._embed = embed
+        # (group, normalized text digest) -> [text, unit embedding or None, value]
+        self._entries: OrderedDict[Tuple[str, str], List[Any]] = OrderedDict()
+        # Requests run the pipeline from worker threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(text: str) -> str:
+        """Normalize a question into a cache key"""
+        return hashlib.sha256(text.strip().lower().encode('utf-8')).hexdigest()
+
+    def _unit_embedding(self, text: str) -> np.ndarray:
+        """Embed text and scale the vector to unit length"""
+        embedding = np.asarray(self._embed(text), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def get(self, text: str, group: str = "") -> Optional[Any]:
+        """Return the value stored for the same or a very similar question, if any"""
+        if self.size <= 0:
+            return None
+
+        key = (group, self._key(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                logger.info(f"{self.name} cache hit (exact)")
+                return entry[2]
+            candidates = [entry for (entry_group, _), entry in self._entries.items() if entry_group == group]
+        if not candidates:
+            return None
+
+        # Embedding failures only cost the cache hit, never the request
+        try:
+            embedding = self._unit_embedding(text)
+            for entry in candidates:
+                if entry[1] is None:
+                    entry[1] = self._unit_embedding(entry[0])
+        except Exception as e:
+            logger.warning(f"{self.name} cache lookup skipped: {e}")
+            return None
+
+        similarities = np.stack([entry[1] for entry in candidates]) @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity:
+            return None
+
+        with self._lock:
+            for cached_key, entry in self._entries.items():
+                if entry is candidates[best]:
+                    self._entries.move_to_end(cached_key)
+                    break
+        logger.info(f"{self.name} cache hit (similarity {similarities[best]:.3f})")
+        return candidates[best][2]
+
+    def put(self, text: str, value: Any, group: str = ""):
+        """Remember a value for a question, evicting the least recently used entry"""
+        if self.size <= 0:
+            return
+
+        key = (group, self._key(text))
+        with self._lock:
+            self._entries[key] = [text, None, value]
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,152 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+try:
+    import simsimd
+except ImportError:  # optional, NumPy is used without it
+    simsimd = None
+
+try:
+    import faiss
+except ImportError:  # optional, only needed with use_faiss
+    faiss = None
+
+from ._kernels import top_k_sqeuclidean
+
+logger = logging.getLogger(__name__)
+
+# Candidates kept per requested result when the int8 scan is reranked
+_RERANK_FACTOR = 10
+
+
+class VectorIndex:
+    """Exact in-memory nearest neighbour search over a collection's embeddings"""
+
+    def __init__(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        metadatas: List[Dict[str, Any]],
+        documents: List[str],
+        quantize: bool = False,
+        use_faiss: bool = False
+    ):
+        self.ids = ids
+        self.metadatas = metadatas
+        self.documents = documents
+        self.matrix = np.asarray(embeddings, dtype=np.float32)
+        # Row norms are fixed, so only the dot products are computed per query
+        self.squared_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+
+        # int8 copy with one scale per row, scanned first when enabled
+        self.quantized: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        if quantize:
+            self.quantized, self.scales = _quantize(self.matrix)
+
+        # Exact FAISS index over the same vectors, searched instead when enabled
+        self.faiss_index = None
+        if use_faiss:
+            if faiss is None:
+                logger.warning("faiss is not installed, searching with NumPy instead")
+            else:
+                self.faiss_index = faiss.IndexFlatL2(self.matrix.shape[1])
+                self.faiss_index.add(self.matrix)
+
+    @classmethod
+    def from_collection(
+        cls,
+        collection,
+        quantize: bool = False,
+        use_faiss: bool = False,
+        page_size: int = 5000
+    ) -> "VectorIndex":
+        """Load every embedding, its metadata and document from a Chroma collection"""
+        ids = []
+        metadatas = []
+        documents = []
+        total = collection.count()
+        # Each page is copied into a preallocated matrix, so only one page of
+        # embeddings is ever held as Python floats
+        matrix = np.empty((total, 0), dtype=np.float32)
+        for offset in range(0, total, page_size):
+            page = collection.get(
+                include=["embeddings", "metadatas", "documents"],
+                limit=page_size,
+                offset=offset
+            )
+            if not page['ids']:
+                break
+            if not matrix.shape[1]:
+                matrix = np.empty((total, len(page['embeddings'][0])), dtype=np.float32)
+            filled = len(ids)
+            matrix[filled:filled + len(page['ids'])] = page['embeddings']
+            ids.extend(page['ids'])
+            metadatas.extend(page['metadatas'])
+            documents.extend(page['documents'])
+
+        index = cls(ids, matrix[:len(ids)], metadatas, documents, quantize=quantize, use_faiss=use_faiss)
+        logger.info(f"Loaded {len(ids)} embeddings into memory ({index.matrix.nbytes / 2**20:.1f} MiB)")
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def query(self, embedding: List[float], n_results: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the positions and distances of the nearest rows, closest first
+
+        Distances are squared L2, the same measure Chroma's default space
+        reports, so scores derived from them match collection.query.
+        """
+        k = min(n_results, len(self.ids))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.faiss_index is not None:
+            distances, nearest = self.faiss_index.search(query[np.newaxis, :], k)
+            return nearest[0], np.maximum(distances[0], 0)
+
+        if self.quantized is not None:
+            # Shortlist with the int8 scan, then rank the shortlist exactly
+            candidates = _top_k(self._quantized_distances(query), k * _RERANK_FACTOR)
+            distances = np.square(self.matrix[candidates] - query).sum(axis=1)
+            best = _top_k(distances, k)
+            return candidates[best], np.maximum(distances[best], 0)
+
+        if simsimd is not None:
+            distances = np.asarray(simsimd.cdist(query[np.newaxis, :], self.matrix, metric="sqeuclidean"))[0]
+        else:
+            # Fused numba kernel when available, plain NumPy otherwise
+            result = top_k_sqeuclidean(self.matrix, query, k)
+            if result is not None:
+                return result
+            distances = self.squared_norms - 2 * (self.matrix @ query) + query @ query
+        nearest = _top_k(distances, k)
+        return nearest, np.maximum(distances[nearest], 0)
+
+    def _quantized_distances(self, query: np.ndarray) -> np.ndarray:
+        """Approximate squared L2 distances from int8 dot products"""
+        quantized_query, query_scale = _quantize(query[np.newaxis, :])
+        if simsimd is not None:
+            dots = np.asarray(simsimd.cdist(quantized_query, self.quantized, metric="dot"))[0]
+        else:
+            dots = np.einsum('ij,j->i', self.quantized, quantized_query[0], dtype=np.int32)
+        dots = dots * self.scales * query_scale[0]
+        return self.squared_norms - 2 * dots + query @ query
+
+
+def _quantize(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantize rows to int8, returning the rows and their float32 scales"""
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales[scales == 0] = 1
+    quantized = np.round(matrix / scales[:, np.newaxis]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def _top_k(distances: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k smallest distances, smallest first"""
+    k = min(k, len(distances))
+    nearest = np.argpartition(distances, k - 1)[:k]
+    return nearest[np.argsort(distances[nearest])]